@@ -6,6 +6,10 @@ from datetime import datetime
 import discord
 from discord.ext import commands
 
+from monitor import LoopMonitor
+from pagination import PaginationManager
+from uploads import AssetCache, SendScheduler
+
 
 async def get_error_message(main_key, sub_key):
     message = read_json("data/errors.json")[main_key][sub_key]
@@ -14,7 +18,7 @@ async def get_error_message(main_key, sub_key):
 
 async def generate_user_error_embed(ctx, message):
     embed = discord.Embed(title="**Error**", description=message, colour=0xA50B06)
-    await ctx.send(embed=embed)
+    await ctx.bot.sends.send(ctx, embed=embed)
 
 
 def read_json(path):
@@ -24,7 +28,8 @@ def read_json(path):
 
 async def send_traceback(ctx, exception):
     tb_lines = traceback.format_exception(type(exception), exception, exception.__traceback__, 4)
-    await ctx.send("An unexpected error occurred and will be logged ~\n```Python\n{}```".format(''.join(tb_lines)))
+    await ctx.bot.sends.send(ctx, "An unexpected error occurred and will be logged ~\n```Python\n{}```".format(
+        ''.join(tb_lines)))
 
     today = datetime.utcnow()
     path_pattern = "logs/{}-{}-{} %s.json".format(today.day, today.month, today.year)
@@ -67,9 +72,21 @@ class Bot(commands.Bot):
         super().__init__(command_prefix=prefix, description="Computer Vision is amazing",
                          activity=discord.Activity(type=discord.ActivityType.listening, name=prefix + "help"))
         self.cog_list = []
+        self.sends = SendScheduler()
+        self.pagination = PaginationManager(self.sends)
+        self.loop_monitor = LoopMonitor()
+        self.assets = AssetCache()
 
     async def on_ready(self):
         print("Name:\t{0}\nID:\t{1}".format(super().user.name, super().user.id))
+        self.loop_monitor.start(self.loop)
+
+    async def on_reaction_add(self, reaction, user):
+        # Single listener for every reaction menu - sessions are looked up by message ID
+        await self.pagination.on_reaction_add(reaction, user)
+
+    async def on_raw_message_delete(self, payload):
+        self.assets.forget_message(payload.message_id)
 
     async def on_command_error(self, ctx, exception):
         # This prevents any commands with local handlers being handled here in on_command_error.
@@ -102,4 +119,6 @@ if __name__ == "__main__":
     bot.load_cog("cogs.owner")
     bot.load_cog("cogs.commands")
     bot.load_cog("cogs.model")
+    if read_json("data/api.json")["enabled"]:
+        bot.load_cog("cogs.api")
     bot.run()
@@ -0,0 +1,158 @@
+import argparse
+import itertools
+import json
+import multiprocessing
+import os
+import sys
+import time
+
+import cv2
+
+from catalog import catalog, get_model_by_alias
+from cogs.model import Model, engine_config, engine_configs
+
+image_extensions = {".png", ".jpg", ".jpeg", ".bmp", ".webp", ".tif", ".tiff"}
+batch_per_worker = 64  # Images handed to the pool at a time for each worker process
+
+# Set in each worker process by init_worker
+worker = {}
+
+
+def find_images(paths):
+    """
+    Lazily walks the given files and directories so huge directories don't have to be listed up front
+
+    :param paths: List of file and directory paths
+    :return: Generator of (image path, output name) tuples - output names keep the layout of any directories given
+    """
+    for path in paths:
+        if os.path.isdir(path):
+            for root, dirs, files in os.walk(path):
+                dirs.sort()
+                for file in sorted(files):
+                    if os.path.splitext(file)[1].lower() in image_extensions:
+                        image_path = os.path.join(root, file)
+                        yield image_path, os.path.splitext(os.path.relpath(image_path, path))[0]
+        else:
+            yield path, os.path.splitext(os.path.basename(path))[0]
+
+
+def init_worker(model, category, confidence, images_dir, threads):
+    # Each worker only gets its share of the cores so the pool doesn't oversubscribe them
+    engine_configs["models"][model] = dict(engine_config(model), threads=threads)
+
+    worker.update({"cog": Model(None),
+                   "model": model,
+                   "category": category,
+                   "confidence": confidence,
+                   "images_dir": images_dir})
+
+
+def process_image(job):
+    """
+    :param job: Tuple of (image path, output name)
+    :return: Dict, the JSONL record for the image
+    """
+    path, output_name = job
+    model, category, confidence = worker["model"], worker["category"], worker["confidence"]
+    record = {"path": path, "model": model, "category": category}
+
+    try:
+        with open(path, "rb") as image_file:
+            img_np, reduction, image, results, text, predictions = worker["cog"].run_pipeline(
+                model, category, confidence, image_file.read(), as_json=True)
+
+        if category in ["ObjectDetection", "Classification"]:
+            record["confidence"] = confidence
+
+        record["duration"] = results.duration
+        record["reduction"] = reduction  # Coordinates are for the image after it was downscaled by this much
+        record["predictions"] = predictions
+
+        if worker["images_dir"] is not None:
+            output_path = os.path.join(worker["images_dir"], output_name + ".png")
+            os.makedirs(os.path.dirname(output_path), exist_ok=True)
+            cv2.imwrite(output_path, image)
+            record["image"] = output_path
+
+    except Exception as e:  # One bad image shouldn't stop the whole run
+        record["error"] = "{}: {}".format(type(e).__name__, e)
+
+    return record
+
+
+def read_checkpoint(output):
+    """
+    :param output: String, path of the JSONL output
+    :return: Set of image paths that already have a successful result in the output
+    """
+    done = set()
+    if not os.path.exists(output):
+        return done
+
+    with open(output, "r") as output_file:
+        for line in output_file:
+            try:
+                record = json.loads(line)
+            except ValueError:  # Partly written line from a run that was killed
+                continue
+            if "error" not in record:
+                done.add(record["path"])
+
+    return done
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Runs a model over a directory of images without Discord")
+    parser.add_argument("model", help="model name or alias, e.g. alwaysai/enet")
+    parser.add_argument("paths", nargs="+", help="image files and/or directories of images")
+    parser.add_argument("-o", "--output", default="predictions.jsonl", help="JSONL file to write predictions to")
+    parser.add_argument("-i", "--images", default=None, help="directory to write annotated images to")
+    parser.add_argument("-c", "--confidence", type=float, default=0.5,
+                        help="confidence for object detection and classification models")
+    parser.add_argument("-w", "--workers", type=int, default=os.cpu_count() or 1, help="number of worker processes")
+    parser.add_argument("-r", "--resume", action="store_true",
+                        help="skip images that already have a result in the output and append to it")
+    args = parser.parse_args(argv)
+
+    # Allowing models without aliases to work
+    model_from_alias = get_model_by_alias(args.model)
+    model = args.model if model_from_alias is None else model_from_alias
+    category = catalog.info(model)["model_parameters_purpose"]
+
+    done = read_checkpoint(args.output) if args.resume else set()
+    jobs = (job for job in find_images(args.paths) if job[0] not in done)
+    threads = max((os.cpu_count() or 1) // args.workers, 1)
+
+    processed = 0
+    failed = 0
+    start = time.time()
+
+    with open(args.output, "a" if args.resume else "w") as output_file, \
+            multiprocessing.Pool(args.workers, init_worker,
+                                 (model, category, args.confidence, args.images, threads)) as pool:
+        # The pool reads everything it's given into its queue straight away, so it's fed in batches to keep the
+        # directory walk lazy
+        while True:
+            batch = list(itertools.islice(jobs, args.workers * batch_per_worker))
+            if len(batch) == 0:
+                break
+
+            for record in pool.imap_unordered(process_image, batch, chunksize=4):
+                output_file.write(json.dumps(record) + "\n")
+                output_file.flush()  # Every written line is a checkpoint for --resume
+
+                processed += 1
+                if "error" in record:
+                    failed += 1
+                    print("Failed: {} ~ {}".format(record["path"], record["error"]), file=sys.stderr)
+                if processed % 100 == 0:
+                    print("{} images ~ {} images/sec".format(processed,
+                                                             round(processed / (time.time() - start), 2)))
+
+    print("Done: {} images ({} failed, {} already done) in {} seconds".format(processed, failed, len(done),
+                                                                              round(time.time() - start, 2)))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,287 @@
+import collections
+import glob
+import os
+import re
+from copy import deepcopy
+
+import discord
+
+from bot import read_json
+from governor import governor
+
+
+def flatten(d, parent_key="", sep="_"):
+    """
+    :param d: Dictionary
+    :param parent_key: Not sure - StackOverflow
+    :param sep: Separator for nested dicts
+    :return: Flattened Dictionary
+    """
+    items = []
+    for k, v in d.items():
+        new_key = parent_key + sep + k if parent_key else k
+        if isinstance(v, collections.MutableMapping):
+            items.extend(flatten(v, new_key, sep=sep).items())
+        else:
+            items.append((new_key, v))
+    return dict(items)
+
+
+def get_model_info(model_name):
+    """
+    Reads straight from disk - use catalog.info() instead unless the catalog is being built
+
+    :param model_name: String, name for the model you wish to get data on. E.g. 'alwaysai/res10_300x300_ssd_iter_140000'
+    :return: Dict, contains the data you requested in the same order
+    """
+    decoded_data = flatten(read_json("models/{}/alwaysai.model.json".format(model_name)))
+    for key in decoded_data:
+        if decoded_data[key] == "":
+            decoded_data[key] = None
+
+    return decoded_data
+
+
+def get_model_by_alias(alias):
+    """
+    :param alias: String, model name alias
+    :return: String model name or None if one isn't found
+    """
+    catalog.ensure_built()
+    if alias in catalog.models:
+        return alias
+    return next((model for model, aliases in model_aliases.items() if alias in aliases), None)
+
+
+def get_model_aliases(model_name):
+    """
+    :param model_name: String, model name
+    :return: List of aliases + model name or None if model has no aliases
+    """
+    if model_name in model_aliases.keys():
+        aliases = deepcopy(model_aliases[model_name])
+        aliases.append(model_name)
+        return aliases
+    return None
+
+
+def limit(text, limit_int):
+    text = str(text)
+    if len(text) > limit_int:
+        if re.match(r"^-?\d+(?:\.\d+)?$", text) is not None:
+            return round(float(text), limit_int)
+        return text[:limit_int - 3] + "..."
+    return text
+
+
+url_regex = re.compile(
+    r"^(?:http|ftp)s?://"  # http:// or https://
+    r"(?:(?:[A-Z0-9](?:[A-Z0-9-]{0,61}[A-Z0-9])?\.)+(?:[A-Z]{2,6}\.?|[A-Z0-9-]{2,}\.?)|"  # domain...
+    r"localhost|"  # localhost...
+    r"\d{1,3}\.\d{1,3}\.\d{1,3}\.\d{1,3})"  # ...or ip
+    r"(?::\d+)?"  # optional port
+    r"(?:/?|[/?]\S+)$", re.IGNORECASE)
+
+
+class ModelCatalog:
+    """
+    Every installed model's info, read once and indexed so model lookups and filtered model lists don't touch the
+    disk. Embeds are rendered the first time they're asked for and reused after that.
+    """
+
+    # Filter/sort name used in *modelhelp: key in the flattened model info
+    fields = {"purpose": "model_parameters_purpose",
+              "framework": "model_parameters_framework_type",
+              "dataset": "dataset",
+              "inference_time": "inference_time"}
+    models_per_page = 10
+    max_list_embeds = 50  # Filters come from users so there's no telling how many different lists get asked for
+    colour = 0x8b0048
+
+    def __init__(self):
+        self.models = []
+        self.entries = {}
+        self.indexes = {}
+        self.detail_embeds = {}
+        self.list_embeds = collections.OrderedDict()
+        self.built = False
+
+    def build(self):
+        """
+        (Re)reads alwaysai.app.json and every model in the models directory
+        """
+        models = list(read_json("alwaysai.app.json")["models"].keys())
+        for path in sorted(glob.glob("models/*/*/alwaysai.model.json")):
+            model = "/".join(os.path.normpath(path).split(os.sep)[1:3])
+            if model not in models:
+                models.append(model)
+
+        entries = {}
+        for model in models:
+            try:
+                entries[model] = get_model_info(model)
+            except FileNotFoundError:  # Listed in alwaysai.app.json but not installed yet
+                pass
+
+        indexes = {name: {} for name in self.fields}
+        for model, data in entries.items():
+            for name, key in self.fields.items():
+                indexes[name].setdefault(str(data.get(key)).lower(), []).append(model)
+
+        self.models = models
+        self.entries = entries
+        self.indexes = indexes
+        self.detail_embeds = {}
+        self.list_embeds.clear()
+        self.built = True
+
+    def ensure_built(self):
+        if not self.built:
+            self.build()
+
+    def info(self, model):
+        """
+        :param model: String, model name
+        :return: Dict, same as get_model_info() - raises FileNotFoundError if the model isn't installed
+        """
+        self.ensure_built()
+        if model not in self.entries:
+            raise FileNotFoundError("models/{}/alwaysai.model.json".format(model))
+        return self.entries[model]
+
+    def query(self, filters=None, sort=None):
+        """
+        :param filters: Dict of field name: value, e.g. {"purpose": "ObjectDetection"} - values aren't case sensitive
+        :param sort: String, field name to sort by or None to keep alwaysai.app.json's order
+        :return: List of model names
+        """
+        self.ensure_built()
+        models = self.models
+        for name, value in (filters or {}).items():
+            matches = set(self.indexes[name].get(str(value).lower(), []))
+            models = [model for model in models if model in matches]
+
+        if sort is not None:
+            key = self.fields[sort]
+
+            def sort_key(model):
+                value = self.entries.get(model, {}).get(key)
+                numeric = isinstance(value, (int, float)) and not isinstance(value, bool)
+                # Missing values go last and numbers go before text - every position in the tuple is always the same
+                # type so models with different types of value can still be compared
+                return (value is None, not numeric, value if numeric else 0, str(value).lower())
+
+            models = sorted(models, key=sort_key)
+
+        return models
+
+    def list_pages(self, filters=None, sort=None):
+        """
+        :return: List of Discord Embeds for the model list, one per page - empty if no models match
+        """
+        filters = filters or {}
+        cache_key = (tuple(sorted(filters.items())), sort)
+        if cache_key in self.list_embeds:
+            self.list_embeds.move_to_end(cache_key)
+            return self.list_embeds[cache_key]
+
+        models = self.query(filters, sort)
+        if sort is None:
+            lines = ["`{}`".format(model) for model in models]
+        else:
+            key = self.fields[sort]
+            lines = ["`{}` ~ {}".format(model, limit(self.entries.get(model, {}).get(key), 50)) for model in models]
+
+        title = "**Model List**"
+        if filters:
+            title += " ~ {}".format(", ".join("{}: {}".format(name, value) for name, value in filters.items()))
+
+        # Formatting all models into a 2D list - each inner list is an unformatted page
+        lines_split = [lines[x:x + self.models_per_page] for x in range(0, len(lines), self.models_per_page)]
+
+        pages = []
+        for page_num, inner_list in enumerate(lines_split):
+            embed = discord.Embed(title=title, description="{}\n\u200b".format("\n".join(inner_list)),
+                                  colour=self.colour)
+            embed.set_footer(text="Page: {}/{}{}".format(page_num + 1, len(lines_split),
+                                                         "" if sort is None else " ~ Sorted by {}".format(sort)))
+            pages.append(embed)
+
+        self.list_embeds[cache_key] = pages
+        while len(self.list_embeds) > self.max_list_embeds:
+            self.list_embeds.popitem(last=False)
+        return pages
+
+    def detail_embed(self, model):
+        """
+        :param model: String, model name
+        :return: Discord Embed with the model's info - copy it before setting its thumbnail
+        """
+        if model in self.detail_embeds:
+            return self.detail_embeds[model]
+
+        data = self.info(model)
+        aliases = get_model_aliases(model)
+
+        # Adding spaces between words
+        # SemanticSegmentation -> Semantic Segmentation
+        category_split = re.findall("[A-Z][^A-Z]*", data["model_parameters_purpose"])
+        category = " ".join(category_split)
+
+        # Limiting values in case a model somehow manages to reach the embed character limit
+        data_keys = list(data.keys())
+        desc_array = []
+        embed_array = [["description", "**Description:**", 1500],
+                       [category, "**Category:**", None],
+                       ["license", "**License:**", 50],
+                       [None, "\n", None],
+                       ["inference_time", "**Inference Time:**", 6],
+                       ["model_parameters_framework_type", "**Framework:**", 50],
+                       ["dataset", "**Dataset:**", 50],
+                       ["version", "**Version:**", 10]]
+
+        for Key, StringVal, CharLimit in embed_array:  # Preventing key errors
+            if Key is None:
+                desc_array.append(StringVal)
+            elif CharLimit is None:
+                desc_array.append("{} {}".format(StringVal, Key))
+            else:
+                if Key in data_keys:
+                    desc_array.append("{} {}".format(StringVal, limit(data[Key], CharLimit)))
+
+        description = "\n".join(desc_array)
+
+        if "id" in data_keys:
+            title = limit(data["id"], 100)
+        else:
+            title = "Unknown Model"
+
+        if aliases is None:
+            description += "\n\n**Aliases:** None"
+        else:
+            embed_aliases = ", ".join(aliases[:-1])
+            description += "\n\n**Aliases:** {}".format(embed_aliases)
+
+        embed = discord.Embed(title=title,
+                              description=description,
+                              colour=self.colour)
+
+        if data["website_url"] is None or re.match(url_regex, data["website_url"]) is not None:
+            embed.url = data["website_url"]
+
+        self.detail_embeds[model] = embed
+        return embed
+
+    def shed_list(self):
+        """
+        :return: Bool, whether the least recently used rendered model list was freed
+        """
+        if len(self.list_embeds) == 0:
+            return False
+        self.list_embeds.popitem(last=False)
+        return True
+
+
+model_aliases = read_json("data/aliases.json")
+catalog = ModelCatalog()
+governor.register("Model list embeds", 0, lambda: len(catalog.list_embeds), catalog.shed_list, on_loop=True)
@@ -0,0 +1,158 @@
+import asyncio
+import json
+
+import cv2
+from aiohttp import web
+from discord.ext import commands
+
+from bot import read_json
+from catalog import catalog, get_model_by_alias
+from governor import governor, ImageTooLargeError, UnreadableImageError
+
+
+class API(commands.Cog):
+    """
+    Local HTTP API for running models - goes through the Model cog so it shares its warm models, queue and caches
+    """
+
+    def __init__(self, bot):
+        self.bot = bot
+        self.config = read_json("data/api.json")
+        self.runner = None
+
+        app = web.Application(client_max_size=self.config["max_upload_mb"] * 1024 * 1024)
+        app.add_routes([web.get("/health", self.health),
+                        web.post("/infer/{model:.+}", self.infer)])
+        self.app = app
+
+        self.bot.loop.create_task(self.start())
+
+    async def start(self):
+        self.runner = web.AppRunner(self.app, keepalive_timeout=self.config["keepalive_timeout"])
+        await self.runner.setup()
+        await web.TCPSite(self.runner, self.config["host"], self.config["port"]).start()
+        print("API:\thttp://{}:{}".format(self.config["host"], self.config["port"]))
+
+    def cog_unload(self):
+        if self.runner is not None:
+            self.bot.loop.create_task(self.runner.cleanup())
+
+    @staticmethod
+    def error_response(status, message):
+        return web.json_response({"error": message}, status=status)
+
+    async def read_part(self, part):
+        """
+        client_max_size only covers request.read()/post() so multipart uploads are read a chunk at a time instead
+
+        :param part: aiohttp BodyPartReader
+        :return: Bytes of the part - raises ImageTooLargeError once it goes over max_upload_mb
+        """
+        max_bytes = self.config["max_upload_mb"] * 1024 * 1024
+        img_bytes = bytearray()
+        while True:
+            chunk = await part.read_chunk()
+            if not chunk:
+                return bytes(img_bytes)
+
+            img_bytes.extend(chunk)
+            if len(img_bytes) > max_bytes:  # The rest of the part is skipped by reader.next()
+                raise ImageTooLargeError("Upload is over {} MB".format(self.config["max_upload_mb"]))
+
+    async def health(self, request):
+        # Imported when needed since cogs.model is replaced whenever the model cog is reloaded
+        from cogs.model import inference_queue
+
+        return web.json_response({"status": "ok" if self.bot.get_cog("Model") is not None else "model cog not loaded",
+                                  "discord_latency_ms": round(self.bot.latency * 1000),
+                                  "queue_pending": inference_queue.pending,
+                                  "queue_completed": inference_queue.completed,
+                                  "rss_mb": governor.rss() // (1024 * 1024),
+                                  "held": dict(governor.usage()),
+                                  "loop_stalls": self.bot.loop_monitor.stall_count,
+                                  "worst_loop_stall_ms": round(self.bot.loop_monitor.worst_stall * 1000),
+                                  "messages_sent": self.bot.sends.sent,
+                                  "messages_delayed": self.bot.sends.delayed})
+
+    async def infer(self, request):
+        """
+        POST /infer/{model}?confidence=0.5&format=json
+
+        The body is either a single image, which gets a JSON result (or the marked up PNG with format=image), or a
+        multipart upload of several images, which gets a JSON line streamed back for each image as it finishes
+        """
+        model_cog = self.bot.get_cog("Model")
+        if model_cog is None:
+            return self.error_response(503, "The model cog isn't loaded")
+
+        # Allowing models without aliases to work
+        model = request.match_info["model"]
+        model_from_alias = get_model_by_alias(model)
+        model = model if model_from_alias is None else model_from_alias
+
+        try:
+            category = catalog.info(model)["model_parameters_purpose"]
+        except FileNotFoundError:
+            return self.error_response(404, "Unknown model: {}".format(model))
+
+        if category not in model_cog.categories:
+            return self.error_response(500, "Unsupported model category: {}".format(category))
+
+        confidence = None
+        if category in ["ObjectDetection", "Classification"]:
+            try:
+                confidence = float(request.query.get("confidence", 0.5))
+            except ValueError:
+                return self.error_response(400, "confidence must be a float")
+
+        async def run(img_bytes, name=None):
+            img_np, reduction, image, results, text, predictions = await model_cog.queue_pipeline(
+                model, category, confidence, img_bytes, as_json=True)
+            result = {"model": model,
+                      "category": category,
+                      "confidence": confidence,
+                      "duration": results.duration,
+                      "reduction": reduction,
+                      "predictions": predictions}
+            if name is not None:
+                result["name"] = name
+            return result, image
+
+        if request.content_type.startswith("multipart/"):
+            response = web.StreamResponse(headers={"Content-Type": "application/x-ndjson"})
+            await response.prepare(request)
+
+            reader = await request.multipart()
+            while True:
+                part = await reader.next()
+                if part is None:
+                    break
+
+                name = part.filename or part.name
+                try:
+                    result, image = await run(await self.read_part(part), name)
+                except asyncio.CancelledError:  # The client went away
+                    raise
+                except Exception as e:  # One bad image shouldn't stop the rest of the upload
+                    result = {"name": name, "error": "{}: {}".format(type(e).__name__, e)}
+                await response.write((json.dumps(result) + "\n").encode("utf-8"))
+
+            await response.write_eof()
+            return response
+
+        try:
+            result, image = await run(await request.read())
+        except ImageTooLargeError as e:
+            return self.error_response(413, str(e))
+        except UnreadableImageError as e:
+            return self.error_response(400, "Couldn't read the image: {}".format(e))
+
+        if request.query.get("format", "json") == "image":
+            encoded, buffer = await asyncio.get_event_loop().run_in_executor(None, cv2.imencode, ".png", image)
+            return web.Response(body=buffer.tobytes(), content_type="image/png")
+
+        return web.json_response(result)
+
+
+def setup(bot):
+    bot.add_cog(API(bot))
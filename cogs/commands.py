@@ -6,7 +6,7 @@ import discord
 from discord.ext import commands
 
 from bot import send_traceback, read_json, get_error_message, generate_user_error_embed
-from cogs.model import get_model_info, get_model_aliases, get_model_by_alias
+from catalog import catalog, get_model_by_alias
 
 
 class Commands(commands.Cog):
@@ -14,6 +14,7 @@ class Commands(commands.Cog):
         self.bot = bot
         self.bot.docs = None
         self.bot.lookup = None
+        catalog.build()  # Reloading this cog picks up newly installed models
 
     def get_docs(self):
 
@@ -81,23 +82,6 @@ class Commands(commands.Cog):
 
         return suggestions
 
-    @staticmethod
-    async def model_help_react(message):
-        await message.add_reaction("\U000023ea")  # Left fast
-        await message.add_reaction("\U00002b05")  # Left
-        await message.add_reaction("\U000027a1")  # Right
-        await message.add_reaction("\U000023e9")  # Right fast
-        await message.add_reaction("<:cross:671116183780720670>")  # Cross
-
-    @staticmethod
-    def limit(text, limit_int):
-        text = str(text)
-        if len(text) > limit_int:
-            if re.match(r"^-?\d+(?:\.\d+)?$", text) is not None:
-                return round(float(text), limit_int)
-            return text[:limit_int - 3] + "..."
-        return text
-
     @commands.command(aliases=["h"])
     async def help(self, ctx, command=None):
         async with ctx.typing():
@@ -105,7 +89,7 @@ class Commands(commands.Cog):
 
             title = help_data["default"]["title"]
             colour = 0xB91C36
-            thumbnail = discord.File("data/HelpThumbnail.png", filename="thumbnail.png")
+            thumbnail_path = "data/HelpThumbnail.png"
 
             # Retrieves command - useful if user wants to use a commands alias
             command = self.bot.get_command(str(command))
@@ -123,7 +107,7 @@ class Commands(commands.Cog):
                 # Different colour for owner commands to help distinguish easier
                 if command.cog.qualified_name == "Owner":
                     colour = 0xB32DBF
-                    thumbnail = discord.File("data/AdminHelpThumbnail.png", filename="thumbnail.png")
+                    thumbnail_path = "data/AdminHelpThumbnail.png"
 
             else:  # If no command exists it uses the default description
                 description = "\n".join(help_data["default"]["description"])
@@ -132,8 +116,11 @@ class Commands(commands.Cog):
             embed = discord.Embed(title="{}**".format(title), description=description, colour=colour)
             embed.set_footer(text=footer)
 
-            embed.set_thumbnail(url="attachment://thumbnail.png")
-        await ctx.send(embed=embed, file=thumbnail)
+            # Thumbnails are only uploaded the first time, after that the uploaded one is reused
+            thumbnail = self.bot.assets.attach(thumbnail_path, embed.set_thumbnail, thumbnail_path, "thumbnail.png")
+        message = await self.bot.sends.send(ctx, embed=embed, file=thumbnail)
+        if thumbnail is not None:
+            self.bot.assets.remember(thumbnail_path, message, "thumbnail.png")
 
     @commands.command(aliases=["i"])
     async def info(self, ctx):
@@ -144,7 +131,7 @@ class Commands(commands.Cog):
                           "`{}` and `{}`\n\n" \
                           "For help on using the bot, try using `*help` and `*help <command>`".format(devs[0], devs[1])
             embed = discord.Embed(title="**Info**", description=description, colour=0x4CD4E0)
-        await ctx.send(embed=embed)
+        await self.bot.sends.send(ctx, embed=embed)
 
     @commands.command(aliases=["f", "search"])
     async def find(self, ctx, *queries):
@@ -178,139 +165,51 @@ class Commands(commands.Cog):
                     embed.set_footer(
                         text="{} other result{} found".format(filtered_results, "s" if filtered_results != 1 else ""))
 
-            await ctx.send(embed=embed)
+            await self.bot.sends.send(ctx, embed=embed)
 
     @commands.command(aliases=["modelhelp", "mhelp", "mh"])
-    async def model_help(self, ctx, model_name=None):
+    async def model_help(self, ctx, *query):
+        # Any "key:value" arguments are treated as filters/sorting for the model list, e.g. purpose:ObjectDetection
+        filters = {}
+        sort = None
+        model_name = None
+        for arg in query:
+            key, sep, value = arg.partition(":")
+            key = key.lower()
+            if not sep:
+                model_name = arg
+            elif key == "sort" and value.lower() in catalog.fields:
+                sort = value.lower()
+            elif key in catalog.fields:
+                filters[key] = value
+            else:
+                await generate_user_error_embed(ctx, await get_error_message("modelHelp", "invalidFilter"))
+                return
+
         model_name = get_model_by_alias(model_name)
 
         if model_name is None:  # No specified model so show list of models
-            decoded_data = read_json("alwaysai.app.json")
-
-            # Formatting all models into a 2D list - each inner list is an unformatted page
-            models_per_page = 10
-            model_list = list(decoded_data["models"].keys())
-            models_split = [model_list[x:x + models_per_page] for x in range(0, len(model_list), models_per_page)]
-
-            # Splitting the page lists into page strings and formatting them to make em look good
-            pages = ["`{}`\n\u200b".format("`\n`".join(inner_list)) for inner_list in models_split]
-            current_page_num = 0
+            pages = catalog.list_pages(filters, sort)
 
             if len(pages) == 0:
-                await generate_user_error_embed(ctx, await get_error_message("modelHelp", "noInstalledModels"))
+                error = "noMatchingModels" if filters else "noInstalledModels"
+                await generate_user_error_embed(ctx, await get_error_message("modelHelp", error))
                 return
 
-            title = "**Model List**"
-            colour = 0x8b0048
-
-            embed = discord.Embed(title=title, description=pages[current_page_num], colour=colour)
-            embed.set_footer(text="Page: {}/{}".format(current_page_num + 1, len(pages)))
-
-            embed_message = await ctx.send(embed=embed)
-            await self.model_help_react(embed_message)
-
-            # Logic behind whether a user reaction is accepted or not
-            def check(reaction, user):
-                valid_emoji_list = ["⏪", "⬅", "➡", "⏩", "<:cross:671116183780720670>"]
-                return str(reaction) in valid_emoji_list and str(reaction.message) == str(embed_message) and \
-                       user == ctx.author
-
-            # Wait for a users reaction
-            while True:
-                reaction, user = await self.bot.wait_for("reaction_add", check=check)
-
-                if ctx.message.guild is not None:
-                    await embed_message.remove_reaction(str(reaction.emoji), user)
-
-                emoji = str(reaction)
-
-                page_changed = True
-
-                if emoji == "<:cross:671116183780720670>":  # Close model_help embed
-                    await embed_message.delete()
-                    return
-
-                elif emoji == "⏪" and current_page_num != 0:  # Go to first page
-                    current_page_num = 0
-                elif emoji == "⬅" and current_page_num != 0:  # Go back a page
-                    current_page_num -= 1
-                elif emoji == "➡" and current_page_num != len(pages) - 1:  # Go forward a page
-                    current_page_num += 1
-                elif emoji == "⏩" and current_page_num != len(pages) - 1:  # Go to last page
-                    current_page_num = len(pages) - 1
-                else:
-                    page_changed = False
-
-                if page_changed:  # Only need to edit the message if the page needs to be changed
-                    embed = discord.Embed(title=title, description=pages[current_page_num], colour=colour)
-                    embed.set_footer(text="Page: {}/{}".format(current_page_num + 1, len(pages)))
-
-                    await embed_message.edit(embed=embed)
+            # Reactions are handled by the bot's pagination manager from here on
+            await self.bot.pagination.paginate(ctx, pages)
 
         else:
             async with ctx.typing():
-                data = get_model_info(model_name)
-                aliases = get_model_aliases(model_name)
-
-                # Adding spaces between words
-                # SemanticSegmentation -> Semantic Segmentation
-                category_split = re.findall("[A-Z][^A-Z]*", data["model_parameters_purpose"])
-                category = " ".join(category_split)
-
-                # Limiting values in case a model somehow manages to reach the embed character limit
-                data_keys = list(data.keys())
-                desc_array = []
-                embed_array = [["description", "**Description:**", 1500],
-                               [category, "**Category:**", None],
-                               ["license", "**License:**", 50],
-                               [None, "\n", None],
-                               ["inference_time", "**Inference Time:**", 6],
-                               ["model_parameters_framework_type", "**Framework:**", 50],
-                               ["dataset", "**Dataset:**", 50],
-                               ["version", "**Version:**", 10]]
-
-                for Key, StringVal, CharLimit in embed_array:  # Preventing key errors
-                    if Key is None:
-                        desc_array.append(StringVal)
-                    elif CharLimit is None:
-                        desc_array.append("{} {}".format(StringVal, Key))
-                    else:
-                        if Key in data_keys:
-                            desc_array.append("{} {}".format(StringVal, self.limit(data[Key], CharLimit)))
-
-                description = "\n".join(desc_array)
-
-                if "id" in data_keys:
-                    title = self.limit(data["id"], 100)
-                else:
-                    title = "Unknown Model"
-
-                if aliases is None:
-                    description += "\n\n**Aliases:** None"
-                else:
-                    embed_aliases = ", ".join(aliases[:-1])
-                    description += "\n\n**Aliases:** {}".format(embed_aliases)
-
-                embed = discord.Embed(title=title,
-                                      description=description,
-                                      colour=0x8b0048)
-
-                thumbnail = discord.File("data/{}.png".format(data["model_parameters_purpose"]),
-                                         filename="thumbnail.png")
-                embed.set_thumbnail(url="attachment://thumbnail.png")
-
-                regex = re.compile(
-                    r"^(?:http|ftp)s?://"  # http:// or https://
-                    r"(?:(?:[A-Z0-9](?:[A-Z0-9-]{0,61}[A-Z0-9])?\.)+(?:[A-Z]{2,6}\.?|[A-Z0-9-]{2,}\.?)|"  # domain...
-                    r"localhost|"  # localhost...
-                    r"\d{1,3}\.\d{1,3}\.\d{1,3}\.\d{1,3})"  # ...or ip
-                    r"(?::\d+)?"  # optional port
-                    r"(?:/?|[/?]\S+)$", re.IGNORECASE)
-
-                if data["website_url"] is None or re.match(regex, data["website_url"]) is not None:
-                    embed.url = data["website_url"]
-
-                await ctx.send(embed=embed, file=thumbnail)
+                # The catalog's embed is shared so it's copied before the thumbnail URL is set on it
+                embed = discord.Embed.from_dict(catalog.detail_embed(model_name).to_dict())
+                thumbnail_path = "data/{}.png".format(catalog.info(model_name)["model_parameters_purpose"])
+                thumbnail = self.bot.assets.attach(thumbnail_path, embed.set_thumbnail, thumbnail_path,
+                                                   "thumbnail.png")
+
+            message = await self.bot.sends.send(ctx, embed=embed, file=thumbnail)
+            if thumbnail is not None:
+                self.bot.assets.remember(thumbnail_path, message, "thumbnail.png")
 
     @model_help.error
     async def model_help_error(self, ctx, error):
@@ -1,5 +1,11 @@
+import asyncio
 import collections
-from copy import deepcopy
+import json
+import os
+import statistics
+import time
+from concurrent.futures import ThreadPoolExecutor
+from copy import copy
 from io import BytesIO
 
 import cv2
@@ -11,93 +17,273 @@ from PIL import Image
 from discord.ext import commands
 
 from bot import send_traceback, read_json, generate_user_error_embed, get_error_message
+from catalog import catalog, get_model_by_alias
+from governor import governor, ImageTooLargeError, UnreadableImageError
 
 
-def flatten(d, parent_key="", sep="_"):
+def engine_config(model):
     """
-    :param d: Dictionary
-    :param parent_key: Not sure - StackOverflow
-    :param sep: Separator for nested dicts
-    :return: Flattened Dictionary
+    :param model: String, model name
+    :return: Dict with the model's engine, accelerator and thread count - falls back to the defaults
     """
-    items = []
-    for k, v in d.items():
-        new_key = parent_key + sep + k if parent_key else k
-        if isinstance(v, collections.MutableMapping):
-            items.extend(flatten(v, new_key, sep=sep).items())
-        else:
-            items.append((new_key, v))
-    return dict(items)
+    config = dict(engine_configs["default"])
+    config.update(engine_configs["models"].get(model, {}))
+    return config
+
+
+def save_engine_config(model, config):
+    """
+    Saves a model's engine config to data/engines.json and drops the warm model so it's reloaded with it - run it
+    through the inference queue since warm models are only touched from there
+
+    :param model: String, model name
+    :param config: Dict with engine, accelerator and threads keys
+    """
+    engine_configs["models"][model] = config
+    with open("data/engines.json", "w") as json_file:
+        json.dump(engine_configs, json_file, indent=2)
+
+    for key in [key for key in warm_models if key[1] == model]:
+        del warm_models[key]
 
 
-def get_model_info(model_name):
+def load_model(model_class, model):
     """
-    :param model_name: String, name for the model you wish to get data on. E.g. 'alwaysai/res10_300x300_ssd_iter_140000'
-    :return: Dict, contains the data you requested in the same order
+    :param model_class: edgeiq class for the model's category, e.g. edgeiq.ObjectDetection
+    :param model: String, model name
+    :return: Loaded edgeiq model - kept warm so later requests don't have to load it again
     """
-    decoded_data = flatten(read_json("models/{}/alwaysai.model.json".format(model_name)))
-    for key in decoded_data:
-        if decoded_data[key] == "":
-            decoded_data[key] = None
+    config = engine_config(model)
 
-    return decoded_data
+    # OpenCV's thread pool is global but models only run one at a time, so setting it per model works
+    cv2.setNumThreads(config["threads"] or -1)  # -1 is OpenCV's default
 
+    key = (model_class.__name__, model)
+    if key in warm_models:
+        warm_models.move_to_end(key)
+        return warm_models[key]
 
-def get_model_by_alias(alias):
+    governor.relieve()  # Making room before loading rather than after, when the new model would be up for shedding
+
+    loaded_model = model_class(model)
+    loaded_model.load(engine=getattr(edgeiq.Engine, config["engine"]),
+                      accelerator=getattr(edgeiq.Accelerator, config["accelerator"]))
+    warm_models[key] = loaded_model
+
+    return loaded_model
+
+
+def shed_warm_model():
     """
-    :param alias: String, model name alias
-    :return: String model name or None if one isn't found
+    :return: Bool, whether the least recently used warm model was freed - the most recently used one is always kept
+    since it's the one being run, shedding it would only mean loading it again on every request
     """
-    models = read_json("alwaysai.app.json")["models"]
-    if alias in models.keys():
-        return alias
-    return next((model for model, aliases in model_aliases.items() if alias in aliases), None)
+    if len(warm_models) <= 1:
+        return False
+    warm_models.popitem(last=False)
+    return True
 
 
-def get_model_aliases(model_name):
+def benchmark_model(model, category, image_array, runs=5):
     """
-    :param model_name: String, model name
-    :return: List of aliases + model name or None if model has no aliases
+    Times every engine, accelerator and thread count combination on this machine. Blocks for a while so run it through
+    the inference queue.
+
+    :param model: String, model name
+    :param category: String, the model's purpose, e.g. 'ObjectDetection'
+    :param image_array: BGR numpy array to run the model on
+    :param runs: Int, number of timed runs for each combination
+    :return: List of (config dict, median seconds) tuples, fastest first
     """
-    if model_name in model_aliases.keys():
-        aliases = deepcopy(model_aliases[model_name])
-        aliases.append(model_name)
-        return aliases
-    return None
+    model_class, method = inference_methods[category]
+    cores = os.cpu_count() or 1
+    thread_counts = sorted({1, 2, max(cores // 2, 1), cores})
+
+    timings = []
+    for engine, accelerator in calibration_engines:
+        try:
+            loaded_model = model_class(model)
+            loaded_model.load(engine=getattr(edgeiq.Engine, engine),
+                              accelerator=getattr(edgeiq.Accelerator, accelerator))
+        except Exception:  # Engine isn't available on this machine, e.g. OpenVINO isn't installed
+            continue
+
+        infer = getattr(loaded_model, method)
+        for threads in thread_counts:
+            cv2.setNumThreads(threads)
+            infer(image_array)  # Warm up run - the first run is always slower
+
+            durations = []
+            for _ in range(runs):
+                start = time.perf_counter()
+                infer(image_array)
+                durations.append(time.perf_counter() - start)
+
+            timings.append(({"engine": engine, "accelerator": accelerator, "threads": threads},
+                            statistics.median(durations)))
+
+    return sorted(timings, key=lambda timing: timing[1])
+
+
+def shed_cached_result():
+    """
+    :return: Bool, whether the oldest cached raw result was freed
+    """
+    if len(cached_results) == 0:
+        return False
+    cached_results.popitem(last=False)
+    return True
+
+
+class InferenceQueue:
+    """
+    Every model run goes through here - a single worker thread keeps models off the event loop and running one at a
+    time, which the per-model OpenCV thread counts rely on
+    """
+
+    def __init__(self):
+        self.executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="Inference")
+        self.pending = 0
+        self.completed = 0
+
+    async def run(self, function, *args):
+        self.pending += 1
+        try:
+            return await asyncio.get_event_loop().run_in_executor(self.executor, function, *args)
+        finally:
+            self.pending -= 1
+            self.completed += 1
+
+
+def predictions_to_json(model, category, results, confidence):
+    """
+    Loads the model for semantic segmentation labels, so only call it from the inference queue's thread - use
+    run_pipeline(as_json=True)
+
+    :param confidence: Float, only used to threshold object detection and classification results
+    :return: List of JSON serialisable predictions for the category
+    """
+    if category == "ObjectDetection":
+        return [{"label": prediction.label,
+                 "confidence": float(prediction.confidence),
+                 "box": [int(prediction.box.start_x), int(prediction.box.start_y),
+                         int(prediction.box.end_x), int(prediction.box.end_y)]}
+                for prediction in threshold(results.predictions, confidence)]
+
+    if category == "Classification":
+        return [{"label": prediction.label, "confidence": float(prediction.confidence)}
+                for prediction in threshold(results.predictions, confidence)]
+
+    if category == "PoseEstimation":
+        return [{"score": float(pose.score),
+                 "key_points": {name: [int(point[0]), int(point[1])] for name, point in pose.key_points.items()}}
+                for pose in results.poses]
+
+    # SemanticSegmentation - the class map is too big to send so it's summarised as pixel counts per label
+    labels = load_model(edgeiq.SemanticSegmentation, model).labels
+    class_ids, counts = np.unique(results.class_map, return_counts=True)
+    return [{"label": labels[int(class_id)], "pixels": int(count)} for class_id, count in zip(class_ids, counts)]
+
+
+def encode_result(image_array, limit):
+    """
+    PNG encoding a large image takes long enough to stall the event loop so run it in an executor
+
+    :param image_array: BGR numpy array
+    :param limit: Int, bytes the PNG has to fit in - the image is shrunk until it does
+    :return: Tuple of (PNG bytes, whether the image had to be shrunk)
+    """
+    resized = False
+    while True:
+        png = cv2.imencode(".png", image_array)[1].tobytes()
+        if len(png) <= limit:
+            return png, resized
+
+        height, width = image_array.shape[:2]
+        image_array = cv2.resize(image_array, (round(width * 0.7), round(height * 0.7)), interpolation=cv2.INTER_AREA)
+        resized = True
+
+
+def threshold(predictions, confidence):
+    """
+    :param predictions: List of edgeiq predictions
+    :param confidence: Float, minimum confidence a prediction needs to be kept
+    :return: List of predictions at or above the confidence
+    """
+    return [prediction for prediction in predictions if prediction.confidence >= confidence]
+
+
+class ConfidenceSession:
+    """
+    Reaction controls on a result message that re-threshold its cached predictions - used by the pagination manager
+    """
+
+    controls = {"\U0001f53d": -0.1,  # Down
+                "\U0001f53c": 0.1}  # Up
+
+    def __init__(self, message, author, cog):
+        self.message = message
+        self.author = author
+        self.cog = cog
+        self.last_used = time.monotonic()
+
+    async def handle(self, emoji):
+        entries = cached_results.get(self.message.id)
+        if entries is None:  # Shed by the memory governor
+            return False
+        cached = entries[0]
+
+        if emoji not in self.controls:
+            return True
+
+        confidence = min(1.0, max(cached.floor, round(cached.confidence + self.controls[emoji], 2)))
+        if confidence == cached.confidence:
+            return True
+
+        await self.cog.rethreshold(self.message, confidence)
+        return False  # The re-thresholded result is sent as a new message with its own session
 
 
 class Model(commands.Cog):
 
     def __init__(self, bot):
         self.bot = bot
+        if bot is not None:  # None when used by bulk.py
+            governor.start(bot.loop)
+        self.categories = {
+            "Classification": self.classification_base,
+            "ObjectDetection": self.detection_base,
+            "PoseEstimation": self.pose_base,
+            "SemanticSegmentation": self.semantic_base
+        }
 
     @staticmethod
-    def detection_base(model, confidence, image_array):
-        detector = edgeiq.ObjectDetection(model)  # model example: "alwaysai/res10_300x300_ssd_iter_140000"
-        detector.load(engine=edgeiq.Engine.DNN)
-
+    def detection_markup(image_array, predictions):
+        """
+        :return: Tuple of (marked up copy of the image, label text or None)
+        """
         centroid_tracker = edgeiq.CentroidTracker(deregister_frames=100, max_distance=50)
-        results = detector.detect_objects(image_array, confidence_level=confidence)
-        objects = centroid_tracker.update(results.predictions)
+        objects = centroid_tracker.update(predictions)
 
-        predictions = []
+        labelled_predictions = []
         for (object_id, prediction) in objects.items():
+            prediction = copy(prediction)  # Predictions are cached raw, so the label can't be changed in place
             prediction.label = "{}: {}".format(prediction.label, object_id)
-            predictions.append(prediction)
+            labelled_predictions.append(prediction)
 
-        image = edgeiq.markup_image(image_array, predictions)
+        image = edgeiq.markup_image(image_array.copy(), labelled_predictions)
 
-        return image, results, None
+        return image, None
 
     @staticmethod
-    def classification_base(model, confidence, image_array):
-        classifier = edgeiq.Classification(model)
-        classifier.load(engine=edgeiq.Engine.DNN)
-
-        results = classifier.classify_image(image_array, confidence_level=confidence)
-        if results.predictions:
-            image_text = "{}, {}%".format(results.predictions[0].label.title().strip(),
-                                          round(results.predictions[0].confidence * 100, 2))
+    def classification_markup(image_array, predictions):
+        """
+        :return: Tuple of (marked up copy of the image, label text or None)
+        """
+        image_array = image_array.copy()
+        if predictions:
+            image_text = "{}, {}%".format(predictions[0].label.title().strip(),
+                                          round(predictions[0].confidence * 100, 2))
             label_width, label_height = cv2.getTextSize(image_text, cv2.QT_FONT_NORMAL, 1, 2)[0]
             scale = image_array.shape[1] / label_width
 
@@ -110,13 +296,31 @@ class Model(commands.Cog):
                         (0, 0, 255),
                         1)
 
-            return image_array, results, image_text
-        return image_array, results, None
+            return image_array, image_text
+        return image_array, None
+
+    # results.predictions holds every prediction down to raw_confidence so the image can be re-thresholded later
+    @staticmethod
+    def detection_base(model, confidence, image_array):
+        detector = load_model(edgeiq.ObjectDetection, model)  # model example: "alwaysai/res10_300x300_ssd_iter_140000"
+
+        results = detector.detect_objects(image_array, confidence_level=min(confidence, raw_confidence))
+        image, text = Model.detection_markup(image_array, threshold(results.predictions, confidence))
+
+        return image, results, text
+
+    @staticmethod
+    def classification_base(model, confidence, image_array):
+        classifier = load_model(edgeiq.Classification, model)
+
+        results = classifier.classify_image(image_array, confidence_level=min(confidence, raw_confidence))
+        image, text = Model.classification_markup(image_array, threshold(results.predictions, confidence))
+
+        return image, results, text
 
     @staticmethod
     def pose_base(model, image_array):
-        pose_estimator = edgeiq.PoseEstimation(model)
-        pose_estimator.load(engine=edgeiq.Engine.DNN)
+        pose_estimator = load_model(edgeiq.PoseEstimation, model)
 
         results = pose_estimator.estimate(image_array)
         image = results.draw_poses(image_array)
@@ -124,19 +328,21 @@ class Model(commands.Cog):
         return image, results
 
     def semantic_base(self, model, image_array):
-        semantic_segmentation = edgeiq.SemanticSegmentation(model)
-        semantic_segmentation.load(engine=edgeiq.Engine.DNN)
+        semantic_segmentation = load_model(edgeiq.SemanticSegmentation, model)
 
-        # Build legend into image, save it to a file and crop the whitespace
-        legend_html = semantic_segmentation.build_legend()
+        # Build legend into image and crop the whitespace - only needs doing once per model
+        if model not in legends:
+            legend_html = semantic_segmentation.build_legend()
 
-        config = imgkit.config(wkhtmltoimage="wkhtmltopdf/bin/wkhtmltoimage.exe")
-        options = {"quiet": ""}
-        imgkit.from_string(legend_html, "data/legend.png", config=self.config, options=options)
+            config = imgkit.config(wkhtmltoimage="wkhtmltopdf/bin/wkhtmltoimage.exe")
+            options = {"quiet": ""}
+            legend_png = imgkit.from_string(legend_html, False, config=config, options=options)
 
-        legend_image = Image.open("data/legend.png")
-        width, height = legend_image.size
-        legend_image.crop((0, 0, 0.61 * width, height)).save("data/legend.png")
+            with Image.open(BytesIO(legend_png)) as legend_image:
+                width, height = legend_image.size
+                legend_buffer = BytesIO()
+                legend_image.crop((0, 0, 0.61 * width, height)).save(legend_buffer, "png")
+            legends[model] = legend_buffer.getvalue()
 
         # Apply the semantic segmentation mask onto the given image
         results = semantic_segmentation.segment_image(image_array)
@@ -145,6 +351,236 @@ class Model(commands.Cog):
 
         return image, results
 
+    def run_pipeline(self, model, category, confidence, img_bytes, as_json=False):
+        """
+        Decodes an image and runs a model on it. Blocks, so use queue_pipeline() from a coroutine
+
+        :param confidence: Float or None for models that don't use a confidence
+        :param img_bytes: Bytes of an encoded image
+        :param as_json: Bool, whether to also build predictions_to_json() - done here since it can load models
+        :return: Tuple of (decoded image, reduction factor, marked up image, results, label text or None, JSON
+        predictions or None)
+        """
+        img_np, reduction = governor.decode(img_bytes)
+
+        if category in ["ObjectDetection", "Classification"]:
+            image, results, text = self.categories[category](model, confidence, img_np)
+        else:
+            image, results = self.categories[category](model, img_np)
+            text = None
+
+        predictions = predictions_to_json(model, category, results, confidence) if as_json else None
+
+        governor.relieve()
+        return img_np, reduction, image, results, text, predictions
+
+    async def queue_pipeline(self, model, category, confidence, img_bytes, as_json=False):
+        """
+        Shared by *model and the HTTP API so they use the same warm models and queue
+        """
+        return await inference_queue.run(self.run_pipeline, model, category, confidence, img_bytes, as_json)
+
+    @staticmethod
+    def result_embed(author, model, confidence, outputs):
+        """
+        :param confidence: Float or None for models that don't use a confidence
+        :param outputs: List of (marked up image, label text or None, results, reduction) tuples, one for each image
+        :return: Discord Embed for the results
+        """
+        embed_output = "**User ID:** {}\n\n**Model:** {}".format(author.id, model)
+        if confidence is not None:
+            embed_output += "\n**Confidence:** {}".format(confidence)
+
+        if len(outputs) == 1:
+            image, text, results, reduction = outputs[0]
+            embed_output += "\n\n**Label:** {}".format(text) if text else ""
+            if reduction != 1:
+                embed_output += "\n\n*This image was downscaled by {}x before running the model*".format(reduction)
+            footer = "Inference time: {} seconds".format(round(results.duration, 5))
+        else:
+            for image_num, (image, text, results, reduction) in enumerate(outputs, 1):
+                embed_output += "\n\n**Image {}:** {} seconds".format(image_num, round(results.duration, 5))
+                embed_output += "\n**Label:** {}".format(text) if text else ""
+                if reduction != 1:
+                    embed_output += "\n*Downscaled by {}x before running the model*".format(reduction)
+            footer = "Total inference time: {} seconds".format(round(sum(output[2].duration for output in outputs), 5))
+
+        embed = discord.Embed(title="", description=embed_output, colour=0xC63D3D)
+        embed.set_author(name=author.name, icon_url=author.avatar_url)
+        embed.set_footer(text=footer)
+
+        return embed
+
+    async def send_results(self, destination, author, model, category, confidence, outputs):
+        """
+        Sends the results in as few messages as possible - each message holds up to max_files_per_message images and
+        stays under Discord's upload size limit
+
+        :param destination: Discord Messageable, e.g. a Context or a Channel
+        :param outputs: List of (marked up image, label text or None, results, reduction) tuples, one for each image
+        :return: List of (Discord Message, index of its first output, index after its last output) tuples
+        """
+        guild = getattr(destination, "guild", None)
+        limit = (max_upload_bytes if guild is None else guild.filesize_limit) - upload_overhead
+
+        # The legend goes in the first message as its own file - a thumbnail is too small to read it
+        legend = legends[model] if category == "SemanticSegmentation" else None
+        legend_size = 0 if legend is None else len(legend)
+
+        # Encoded in parallel off the loop, each image shrunk on its own if it doesn't fit in a message by itself
+        encoded = await asyncio.gather(*[self.bot.loop.run_in_executor(None, encode_result, output[0],
+                                                                       limit - legend_size)
+                                         for output in outputs])
+
+        messages = []
+        start = 0
+        while start < len(outputs):
+            group_legend = legend if start == 0 else None
+            files = 0 if group_legend is None else 1
+            size = 0 if group_legend is None else legend_size
+
+            end = start
+            while end < len(outputs) and files < max_files_per_message and size + len(encoded[end][0]) <= limit:
+                files += 1
+                size += len(encoded[end][0])
+                end += 1
+
+            embed = self.result_embed(author, model, confidence, outputs[start:end])
+            if any(resized for png, resized in encoded[start:end]):
+                embed.description += "\n\n*Some time was spent resizing for Discord\n" \
+                                     "Inference time is correct for the amount of time AAI took*"
+
+            message = await self.send_group(destination, embed, [png for png, resized in encoded[start:end]],
+                                            group_legend)
+            messages.append((message, start, end))
+            start = end
+
+        return messages
+
+    async def send_group(self, destination, embed, pngs, legend=None):
+        """
+        :param pngs: List of PNG bytes, one for each image in the message
+        :param legend: PNG bytes of the semantic segmentation legend to send after the images or None
+        :return: Discord Message the images were sent in
+        """
+        files = [discord.File(fp=BytesIO(png), filename="results_{}.png".format(image_num))
+                 for image_num, png in enumerate(pngs, 1)]
+
+        # Only the first image can go in the embed, the rest show up as attachments underneath it
+        embed.set_image(url="attachment://results_1.png")
+
+        if legend is not None:
+            files.append(discord.File(fp=BytesIO(legend), filename="legend.png"))
+
+        return await self.bot.sends.send(destination, embed=embed, files=files)
+
+    async def track_results(self, message, entries):
+        """
+        Caches the raw predictions for a result message and adds the confidence reaction controls
+
+        :param entries: List of CachedResults, one for each image in the message
+        """
+        cached_results[message.id] = entries
+        while len(cached_results) > max_cached_results:
+            cached_results.popitem(last=False)
+
+        self.bot.pagination.register(ConfidenceSession(message, entries[0].author, self))
+        for emoji in ConfidenceSession.controls:
+            await message.add_reaction(emoji)
+
+    def redraw(self, cached, confidence):
+        """
+        Decodes a cached result's image again and marks it up at a new confidence. Blocks, so run it through the
+        inference queue
+
+        :param cached: CachedResult
+        :return: Tuple of (marked up image, label text or None)
+        """
+        img_np = governor.decode(cached.img_bytes)[0]  # Same image as before since decoding is deterministic
+        markup = self.detection_markup if cached.category == "ObjectDetection" else self.classification_markup
+        return markup(img_np, threshold(cached.results.predictions, confidence))
+
+    async def rethreshold(self, message, confidence):
+        """
+        Re-filters and re-annotates a cached result, the model isn't run again
+
+        :param message: Discord Message of the original result - replaced by a new message
+        :param confidence: Float, new confidence
+        :return: Bool, False if the result isn't cached anymore, e.g. it was shed or already re-thresholded
+        """
+        # Taken out straight away so a second reaction/command can't re-threshold it while this one is sending
+        entries = cached_results.pop(message.id, None)
+        if entries is None:
+            return False
+
+        try:
+            outputs = []
+            for cached in entries:
+                image, text = await inference_queue.run(self.redraw, cached, confidence)
+                outputs.append((image, text, cached.results, cached.reduction))
+
+            first = entries[0]
+            sent = await self.send_results(message.channel, first.author, first.model, first.category, confidence,
+                                           outputs)
+        except Exception:  # Nothing was replaced so the original result can still be re-thresholded
+            cached_results[message.id] = entries
+            raise
+
+        for new_message, start, end in sent:
+            await self.track_results(new_message,
+                                     [cached._replace(confidence=confidence) for cached in entries[start:end]])
+
+        try:
+            await message.delete()
+        except discord.errors.NotFound:  # Already deleted by the user
+            pass
+        return True
+
+    @commands.command(aliases=["conf", "threshold"])
+    async def confidence(self, ctx, confidence: float, message_id: int = None):
+        async with ctx.typing():
+            if message_id is None:  # Defaults to the user's most recent result in this channel
+                message_id = next((cached_id for cached_id, entries in reversed(list(cached_results.items()))
+                                   if entries[0].author == ctx.author and entries[0].channel_id == ctx.channel.id),
+                                  None)
+
+            cached = cached_results.get(message_id, [None])[0]
+            if cached is None or cached.author != ctx.author:
+                await generate_user_error_embed(ctx, await get_error_message("confidence", "noCachedResult"))
+                return
+
+            if confidence < cached.floor or confidence > 1:
+                await generate_user_error_embed(ctx, await get_error_message("confidence", "invalidConfidence"))
+                return
+
+            message = await ctx.channel.fetch_message(message_id)
+            if not await self.rethreshold(message, confidence):  # Dropped while the message was being fetched
+                await generate_user_error_embed(ctx, await get_error_message("confidence", "noCachedResult"))
+                return
+
+        if ctx.message.guild is not None:
+            await ctx.message.delete()
+
+    @confidence.error
+    async def confidence_error(self, ctx, error):
+        error_handled = False
+
+        # Singular errors
+        if isinstance(error, (discord.ext.commands.errors.MissingRequiredArgument,
+                              discord.ext.commands.errors.BadArgument)):
+            await generate_user_error_embed(ctx, await get_error_message("confidence", "invalidConfidence"))
+            error_handled = True
+
+        # Wrapped errors e.g: discord.ext.commands.errors.CommandInvokeError: ... NotFound: ...
+        error = getattr(error, "original", error)
+
+        if isinstance(error, discord.errors.NotFound):
+            await generate_user_error_embed(ctx, await get_error_message("general", "error404"))
+            error_handled = True
+
+        if not error_handled:
+            await send_traceback(ctx, error)
+
     # TODO Fix Alpha Channel issue
     @commands.command(aliases=["m"])
     async def model(self, ctx, model, confidence=""):
@@ -156,81 +592,40 @@ class Model(commands.Cog):
             model_from_alias = get_model_by_alias(model)
             model = model if model_from_alias is None else model_from_alias
 
-            category = get_model_info(model)["model_parameters_purpose"]
+            category = catalog.info(model)["model_parameters_purpose"]
 
             if len(attachments) == 0:
                 await generate_user_error_embed(ctx, await get_error_message("model", "missingAttachment"))
                 return
 
+            if category not in self.categories:
+                await generate_user_error_embed(ctx, await get_error_message("model", "invalidModelCategory"))
+                return
+
+            if category in ["ObjectDetection", "Classification"]:
+                try:
+                    confidence = float(confidence)
+                except (ValueError, TypeError):
+                    confidence = 0.5
+            else:
+                confidence = None
+
+            outputs = []
+            entries = []
             for img in attachments:  # Iterating through each image in the message - only works for mobile
-                # Getting image and converting it to appropriate data type
                 img_bytes = await img.read()
-                np_arr = np.fromstring(img_bytes, np.uint8)
-                img_np = cv2.imdecode(np_arr, 1)
-
-                embed_output = ""
-
-                categories = {
-                    "Classification": self.classification_base,
-                    "ObjectDetection": self.detection_base,
-                    "PoseEstimation": self.pose_base,
-                    "SemanticSegmentation": self.semantic_base
-                }
-
-                if category in ["ObjectDetection", "Classification"]:
-                    try:
-                        confidence = float(confidence)
-                    except (ValueError, TypeError):
-                        confidence = 0.5
-
-                    image, results, text = categories[category](model, confidence, img_np)
-                    embed_output = "\n**Confidence:** {}".format(confidence)
-                    embed_output += "\n\n**Label:** {}".format(text) if text else ""
-                elif category in ["PoseEstimation", "SemanticSegmentation"]:
-                    image, results = categories[category](model, img_np)
-                else:
-                    await generate_user_error_embed(ctx, await get_error_message("model", "invalidModelCategory"))
-
-                embed_output = "**User ID:** {}\n\n**Model:** {}".format(ctx.author.id, model) + embed_output
-
-                embed = discord.Embed(title="", description=embed_output, colour=0xC63D3D)
-                embed.set_author(name=ctx.author.name, icon_url=ctx.author.avatar_url)
-                embed.set_footer(text="Inference time: {} seconds".format(round(results.duration, 5)))
-
-                resized = False
-
-                with Image.fromarray(cv2.cvtColor(image, cv2.COLOR_BGR2RGB)) as im:
-                    while True:
-                        try:
-                            # Converting resulting magic for Discord - AAI uses BGR format, Discord uses RGB format
-                            output_buffer = BytesIO()
-                            im.save(output_buffer, "png")
-                            output_buffer.seek(0)
-                            # print(sys.getsizeof(output_buffer))
-
-                            disc_image = discord.File(fp=output_buffer, filename="results.png")
-                            embed.set_image(url="attachment://results.png")
-
-                            await ctx.send(embed=embed, file=disc_image)
-
-                            if category == "SemanticSegmentation":
-                                legend_embed = discord.Embed(title="Legend", colour=0xC63D3D)
-                                image_legend = discord.File("data/legend.png")
-                                legend_embed.set_image(url="attachment://legend.png")
-                                await ctx.send(embed=legend_embed, file=image_legend)
-
-                            break
-
-                        except discord.errors.HTTPException as e:  # Resize until no 413 error
-                            if e.status == 413:
-                                im = im.resize((round(im.width * 0.7), round(im.height * 0.7)))
-                                if not resized:
-                                    embed_output += "\n\n*Some time was spent resizing this image for Discord\n" \
-                                                    "Inference time is correct for the amount of time AAI took*"
-                                    embed.description = embed_output
-                                    resized = True
-                            else:
-                                raise e
+                img_np, reduction, image, results, text, _ = await self.queue_pipeline(model, category, confidence,
+                                                                                       img_bytes)
+                outputs.append((image, text, results, reduction))
+                entries.append(CachedResult(ctx.author, ctx.channel.id, model, category, img_bytes, results, confidence,
+                                            None if confidence is None else min(confidence, raw_confidence),
+                                            reduction))
+
+            for message, start, end in await self.send_results(ctx, ctx.author, model, category, confidence,
+                                                               outputs):
+                if confidence is not None:
+                    # Keeping the raw predictions so a new confidence doesn't need the model to run again
+                    await self.track_results(message, entries[start:end])
 
         if ctx.message.guild is not None:
             await ctx.message.delete()
@@ -251,6 +646,14 @@ class Model(commands.Cog):
             await generate_user_error_embed(ctx, await get_error_message("model", "invalidModelName"))
             error_handled = True
 
+        if isinstance(error, ImageTooLargeError):
+            await generate_user_error_embed(ctx, await get_error_message("model", "imageTooLarge"))
+            error_handled = True
+
+        if isinstance(error, UnreadableImageError):
+            await generate_user_error_embed(ctx, await get_error_message("model", "unreadableImage"))
+            error_handled = True
+
         if isinstance(error, discord.errors.Forbidden):
             await generate_user_error_embed(ctx, await get_error_message("general", "error403"))
             error_handled = True
@@ -268,4 +671,31 @@ def setup(bot):
     bot.add_cog(Model(bot))
 
 
-model_aliases = read_json("data/aliases.json")
+warm_models = collections.OrderedDict()  # (edgeiq class name, model name): loaded model, least recently used first
+inference_queue = InferenceQueue()
+engine_configs = read_json("data/engines.json")
+
+# Used by benchmark_model - category: (edgeiq class, inference method name)
+inference_methods = {"Classification": (edgeiq.Classification, "classify_image"),
+                     "ObjectDetection": (edgeiq.ObjectDetection, "detect_objects"),
+                     "PoseEstimation": (edgeiq.PoseEstimation, "estimate"),
+                     "SemanticSegmentation": (edgeiq.SemanticSegmentation, "segment_image")}
+# (edgeiq.Engine name, edgeiq.Accelerator name) - OpenVINO is OpenCV DNN's Inference Engine backend and runs the
+# optimised/quantised IR version of a model when one exists
+calibration_engines = [("DNN", "CPU"),
+                       ("DNN_OPENVINO", "CPU")]
+governor.register("Warm models", 10, lambda: len(warm_models), shed_warm_model)
+
+legends = {}  # Model name: PNG bytes of its semantic segmentation legend
+max_files_per_message = 10  # Discord's limit
+max_upload_bytes = 8 * 1024 * 1024  # Discord's upload limit outside of boosted servers, which have their own
+upload_overhead = 256 * 1024  # Room left for the embed and multipart encoding
+
+# Object detection and classification results are cached with every prediction down to raw_confidence
+raw_confidence = 0.05
+max_cached_results = 50
+# The encoded image is kept rather than the decoded one, which would be many times bigger
+CachedResult = collections.namedtuple("CachedResult", ["author", "channel_id", "model", "category", "img_bytes",
+                                                       "results", "confidence", "floor", "reduction"])
+cached_results = collections.OrderedDict()  # Result message ID: list of CachedResults, oldest first
+governor.register("Raw predictions", 5, lambda: len(cached_results), shed_cached_result, on_loop=True)
@@ -1,14 +1,18 @@
 import platform
 import sys
 import time
-from io import StringIO
+from io import BytesIO, StringIO
 
 import discord
+import numpy as np
 import psutil
 from discord.ext import commands
 
 from bot import send_traceback, generate_user_error_embed, get_error_message
+from catalog import catalog, get_model_by_alias
 from cogs.model import read_json
+from governor import governor, ImageTooLargeError, UnreadableImageError
+from monitor import sample_profile
 
 
 class Owner(commands.Cog):
@@ -54,7 +58,7 @@ class Owner(commands.Cog):
                                               "{}"
                                               "```".format(code, result_string),
                                   colour=self.colour)
-        await ctx.send(embed=embed)
+        await self.bot.sends.send(ctx, embed=embed)
 
     @commands.command(aliases=["c", "cogs"], hidden=True)
     async def cog(self, ctx, variant, *cog_list):
@@ -89,7 +93,7 @@ class Owner(commands.Cog):
                     await send_traceback(ctx, e)
 
             embed = discord.Embed(title=variant, description=desc, colour=self.colour)
-        await ctx.send(embed=embed)
+        await self.bot.sends.send(ctx, embed=embed)
 
     @cog.error
     async def cog_error(self, ctx, error):
@@ -149,11 +153,156 @@ class Owner(commands.Cog):
                                 "{} ms".format(round(self.bot.latency * 1000))
                                 )
 
-            template = CPU + RAM + PING
+            RSS = governor.rss() / 1024000000
+            LIMIT = governor.rss_soft_limit / 1024000000
+            held = "\n".join("{0:<36}{1:>18}".format(name, count) for name, count in governor.usage())
+            decisions = "\n".join(governor.decisions) if governor.decisions else "No decisions made yet"
+
+            GOVERNOR = "\n\n:scales: **MEMORY GOVERNOR**" \
+                       "```" \
+                       "{0:^27}|{1:^27}\n" \
+                       "{2:^27}|{3:^27}\n\n" \
+                       "{4}" \
+                       "```" \
+                       "```" \
+                       "{5}" \
+                       "```".format("Bot RSS:", "Soft Limit:",
+                                    "{} GB".format(round(RSS, 2)),
+                                    "{} GB".format(round(LIMIT, 2)),
+                                    held,
+                                    decisions
+                                    )
+
+            monitor = self.bot.loop_monitor
+            LOOP = "\n\n:hourglass: **EVENT LOOP**" \
+                   "```" \
+                   "{0:^18}|{1:^18}|{2:^18}\n" \
+                   "{3:^18}|{4:^18}|{5:^18}" \
+                   "```".format("Stalls:", "Worst Stall:", "Last Stall:",
+                                monitor.stall_count,
+                                "{} ms".format(round(monitor.worst_stall * 1000)),
+                                "{} ms".format(round(monitor.stalls[-1]["duration"] * 1000))
+                                if monitor.stalls else "None")
+
+            template = CPU + RAM + PING + LOOP + GOVERNOR
             embed.description = template
             embed.set_footer(text="Python {}\n"
                                   "Discord.py {}".format(platform.python_version(), discord.__version__))
-        await ctx.send(embed=embed)
+        await self.bot.sends.send(ctx, embed=embed)
+
+    @commands.command(aliases=["stalls"])
+    async def lag(self, ctx):
+        async with ctx.typing():
+            monitor = self.bot.loop_monitor
+            stalls = list(monitor.stalls)  # The monitor's thread appends to the deque so it's copied before reading
+
+            if len(stalls) == 0:
+                description = "No event loop stalls over {} ms have been recorded".format(
+                    round(monitor.threshold * 1000))
+            else:
+                stall_list = "\n".join("{} UTC ~ {} ms".format(stall["time"].strftime("%H:%M:%S"),
+                                                               round(stall["duration"] * 1000))
+                                       for stall in reversed(stalls))
+                # Keeping the end of the stack since that's where the blocking call is
+                stack = "".join(stalls[-1]["stack"])[-1200:]
+                description = "**Recent Stalls:**```{}```\n" \
+                              "**Latest Stall Stack:**```Python\n{}```".format(stall_list[:600], stack)
+
+            embed = discord.Embed(title="Event Loop Stalls", description=description, colour=self.colour)
+            embed.set_footer(text="Stalls are loop blocks longer than {} ms".format(round(monitor.threshold * 1000)))
+        await self.bot.sends.send(ctx, embed=embed)
+
+    @commands.command(aliases=["prof"])
+    async def profile(self, ctx, seconds: float = 10):
+        async with ctx.typing():
+            seconds = min(max(seconds, 1), 60)
+
+            # Sampling happens in another thread so the loop (and whatever is slowing it down) keeps running
+            collapsed = await self.bot.loop.run_in_executor(None, sample_profile, seconds)
+
+            embed = discord.Embed(title="Profile",
+                                  description="Sampled every thread for {} seconds.\n"
+                                              "The file is in collapsed stack format - drop it into "
+                                              "[speedscope](https://www.speedscope.app/) or "
+                                              "`flamegraph.pl` to get a flame graph.".format(seconds),
+                                  colour=self.colour)
+            profile_file = discord.File(BytesIO(collapsed.encode("utf-8")), filename="profile.collapsed")
+        await self.bot.sends.send(ctx, embed=embed, file=profile_file)
+
+    @commands.command(aliases=["calib", "bench"])
+    async def calibrate(self, ctx, model, runs: int = 5):
+        async with ctx.typing():
+            # Allowing models without aliases to work
+            model_from_alias = get_model_by_alias(model)
+            model = model if model_from_alias is None else model_from_alias
+            category = catalog.info(model)["model_parameters_purpose"]
+
+            # Imported when needed since cogs.model is replaced whenever the model cog is reloaded. Going through the
+            # queue keeps the timings fair since nothing else can run a model at the same time
+            from cogs.model import inference_queue, benchmark_model, engine_config, save_engine_config
+
+            if len(ctx.message.attachments) > 0:
+                image = (await inference_queue.run(governor.decode, await ctx.message.attachments[0].read()))[0]
+            else:  # Random noise is close enough when timing - models take as long no matter what's in the image
+                image = np.random.randint(0, 256, (480, 640, 3), dtype=np.uint8)
+
+            timings = await inference_queue.run(benchmark_model, model, category, image, min(max(runs, 1), 50))
+
+            if len(timings) == 0:
+                await generate_user_error_embed(ctx, await get_error_message("calibrate", "noEngines"))
+                return
+
+            fastest = timings[0][0]
+            previous = engine_config(model)
+            await inference_queue.run(save_engine_config, model, fastest)  # Drops warm models the queue could be using
+
+            table = "\n".join("{0:<14}{1:<9}{2:^9}{3:>10}".format(config["engine"], config["accelerator"],
+                                                                  config["threads"],
+                                                                  "{} ms".format(round(duration * 1000, 1)))
+                              for config, duration in timings)
+            header = "{0:<14}{1:<9}{2:^9}{3:>10}".format("Engine", "Accel", "Threads", "Median")
+            description = "**Model:** {0}\n\n" \
+                          "```{1}\n{2}```\n" \
+                          "**Saved:** {3} / {4} / {5} threads\n" \
+                          "**Previous:** {6} / {7} / {8} threads".format(model, header, table,
+                                                                          fastest["engine"], fastest["accelerator"],
+                                                                          fastest["threads"],
+                                                                          previous["engine"], previous["accelerator"],
+                                                                          previous["threads"] or "default")
+
+            embed = discord.Embed(title="Calibration", description=description, colour=self.colour)
+        await self.bot.sends.send(ctx, embed=embed)
+
+    @calibrate.error
+    async def calibrate_error(self, ctx, error):
+        error_handled = False
+
+        # Singular errors
+        if isinstance(error, discord.ext.commands.errors.MissingRequiredArgument):
+            await generate_user_error_embed(ctx, await get_error_message("calibrate", "missingModelName"))
+            error_handled = True
+
+        if isinstance(error, discord.ext.commands.errors.CheckFailure):
+            await generate_user_error_embed(ctx, await get_error_message("general", "invalidPerms"))
+            error_handled = True
+
+        # Wrapped errors e.g: discord.ext.commands.errors.CommandInvokeError: ... FileNotFoundError: ...
+        error = getattr(error, "original", error)
+
+        if isinstance(error, FileNotFoundError):
+            await generate_user_error_embed(ctx, await get_error_message("model", "fileNotFound"))
+            error_handled = True
+
+        if isinstance(error, ImageTooLargeError):
+            await generate_user_error_embed(ctx, await get_error_message("model", "imageTooLarge"))
+            error_handled = True
+
+        if isinstance(error, UnreadableImageError):
+            await generate_user_error_embed(ctx, await get_error_message("model", "unreadableImage"))
+            error_handled = True
+
+        if not error_handled:
+            await send_traceback(ctx, error)
 
 
 def setup(bot):
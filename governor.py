@@ -0,0 +1,180 @@
+import asyncio
+import collections
+import gc
+import threading
+from datetime import datetime
+from io import BytesIO
+
+import cv2
+import numpy as np
+import psutil
+from PIL import Image
+
+from bot import read_json
+
+
+class ImageTooLargeError(Exception):
+    pass
+
+
+class UnreadableImageError(Exception):
+    pass
+
+
+class MemoryGovernor:
+    """
+    Keeps the bot from decoding images that are too large and sheds warm models/caches when the process' RSS
+    gets too high. Anything that holds onto memory can register itself using register() and will be shed in
+    priority order (lowest first) whenever the RSS goes over the soft limit.
+    """
+
+    # cv2.imdecode flags that decode an image at 1/n of its size
+    reduced_flags = {1: cv2.IMREAD_COLOR,
+                     2: cv2.IMREAD_REDUCED_COLOR_2,
+                     4: cv2.IMREAD_REDUCED_COLOR_4,
+                     8: cv2.IMREAD_REDUCED_COLOR_8}
+
+    def __init__(self, max_pixels, max_declared_pixels, max_full_decode_pixels, rss_soft_limit_mb):
+        """
+        :param max_pixels: Int, images with more pixels than this get downscaled while decoding
+        :param max_declared_pixels: Int, JPEGs declaring more pixels than this in their header get rejected
+        :param max_full_decode_pixels: Int, same as max_declared_pixels for every other format - OpenCV can only
+        decode JPEGs at a reduced size, anything else is decoded at full size and then shrunk
+        :param rss_soft_limit_mb: Int, RSS in MB above which registered caches start being shed
+        """
+        self.max_pixels = max_pixels
+        self.max_declared_pixels = max_declared_pixels
+        self.max_full_decode_pixels = max_full_decode_pixels
+        self.rss_soft_limit = rss_soft_limit_mb * 1024 * 1024
+        self.process = psutil.Process()
+        self.sheddables = {}
+        self.decisions = collections.deque(maxlen=10)
+        self.loop = None
+        self.loop_thread_id = None
+
+    def start(self, loop):
+        """
+        Has to be called from the loop's thread - after this, items registered with on_loop are only ever shed there
+
+        :param loop: The bot's event loop
+        """
+        self.loop = loop
+        self.loop_thread_id = threading.get_ident()
+
+    def log(self, decision):
+        self.decisions.append("{} {}".format(datetime.utcnow().strftime("%H:%M:%S"), decision))
+
+    def rss(self):
+        return self.process.memory_info().rss
+
+    def register(self, name, priority, size, shed, on_loop=False):
+        """
+        Registering under a name that already exists replaces it - useful for when cogs are reloaded
+
+        :param name: String, name shown in *sys and the decision log
+        :param priority: Int, lower priorities are shed first
+        :param size: Callable returning how many items are currently held
+        :param shed: Callable that frees a single item, returns False once there's nothing left to free
+        :param on_loop: Bool, whether the items are used by coroutines - relieve() is called from the inference
+        thread so shedding them is handed over to the event loop
+        """
+        self.sheddables[name] = (priority, size, shed, on_loop)
+
+    def shed_group(self, shed):
+        """
+        :param shed: Callable from register()
+        :return: Int, number of items shed until the RSS went under the soft limit or there was nothing left to shed
+        """
+        shed_count = 0
+        while self.rss() > self.rss_soft_limit and shed():
+            shed_count += 1
+        return shed_count
+
+    def shed_group_on_loop(self, shed):
+        """
+        Same as shed_group() but run on the loop's thread and waited for - one round trip for the whole group
+        """
+        if self.loop is None or not self.loop.is_running() or threading.get_ident() == self.loop_thread_id:
+            return self.shed_group(shed)
+
+        async def call():
+            return self.shed_group(shed)
+
+        try:
+            return asyncio.run_coroutine_threadsafe(call(), self.loop).result(timeout=5)
+        except Exception:  # The loop's blocked or shutting down - better to move on to the next group than wait
+            return 0
+
+    def usage(self):
+        """
+        :return: List of (name, item count) tuples in shedding order
+        """
+        return [(name, size()) for name, (priority, size, shed, on_loop) in
+                sorted(self.sheddables.items(), key=lambda item: item[1][0])]
+
+    def reduction_factor(self, width, height, image_format="JPEG"):
+        """
+        :param image_format: String, PIL's name for the image's format
+        :return: Int, the smallest supported factor that fits the image within max_pixels
+        """
+        pixels = width * height
+        if pixels <= (self.max_declared_pixels if image_format == "JPEG" else self.max_full_decode_pixels):
+            for factor in sorted(self.reduced_flags):
+                if pixels / (factor * factor) <= self.max_pixels:
+                    return factor
+
+        self.log("Rejected {}x{} {} image".format(width, height, image_format))
+        raise ImageTooLargeError("Image is {}x{} ({} pixels)".format(width, height, pixels))
+
+    def decode(self, img_bytes):
+        """
+        Reads the declared size from the image header before decoding, so pixel bombs never get decoded
+
+        :param img_bytes: Bytes of an encoded image
+        :return: Tuple of (BGR numpy array, reduction factor used)
+        """
+        try:
+            with Image.open(BytesIO(img_bytes)) as im:  # Only parses the header - pixel data is loaded lazily
+                width, height = im.size
+                image_format = im.format
+        except Image.DecompressionBombError as e:  # PIL's own check kicks in before ours for really big images
+            self.log("Rejected image over PIL's pixel limit")
+            raise ImageTooLargeError(str(e))
+        except OSError as e:  # Not an image PIL recognises
+            raise UnreadableImageError(str(e))
+
+        factor = self.reduction_factor(width, height, image_format)
+        if factor != 1:
+            self.log("Downscaled {}x{} {} image by {}x".format(width, height, image_format, factor))
+
+        self.relieve()
+        image = cv2.imdecode(np.frombuffer(img_bytes, np.uint8), self.reduced_flags[factor])
+        if image is None:  # PIL can read the header of some formats OpenCV can't decode, e.g. GIF
+            raise UnreadableImageError("OpenCV can't decode {} images".format(image_format))
+        return image, factor
+
+    def relieve(self):
+        """
+        Sheds registered items in priority order until the RSS is back under the soft limit
+
+        :return: Int, number of items shed
+        """
+        shed_count = 0
+        for name, (priority, size, shed, on_loop) in sorted(self.sheddables.items(), key=lambda item: item[1][0]):
+            if self.rss() <= self.rss_soft_limit:
+                break
+
+            group_count = self.shed_group_on_loop(shed) if on_loop else self.shed_group(shed)
+            if group_count > 0:
+                # Models hold onto large buffers in reference cycles so RSS won't drop without this - it's a full
+                # collection that holds the GIL, so only once per group rather than after every item
+                gc.collect()
+                shed_count += group_count
+                self.log("Shed {} from {} (RSS {} MB)".format(group_count, name, self.rss() // (1024 * 1024)))
+
+        return shed_count
+
+
+_config = read_json("data/governor.json")
+governor = MemoryGovernor(_config["max_pixels"], _config["max_declared_pixels"], _config["max_full_decode_pixels"],
+                          _config["rss_soft_limit_mb"])
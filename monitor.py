@@ -0,0 +1,102 @@
+import asyncio
+import collections
+import os
+import sys
+import threading
+import time
+import traceback
+from datetime import datetime
+
+
+class LoopMonitor:
+    """
+    Watches the event loop from a separate thread. A coroutine on the loop updates a heartbeat and if the heartbeat
+    goes stale for longer than `threshold` seconds the loop is blocked - the loop thread's stack is grabbed at that
+    point so the code doing the blocking can be found later.
+    """
+
+    def __init__(self, threshold=0.25, interval=0.05, max_stalls=20):
+        """
+        :param threshold: Float, seconds the loop has to be blocked for to count as a stall
+        :param interval: Float, seconds between heartbeats
+        :param max_stalls: Int, number of recent stalls to keep
+        """
+        self.threshold = threshold
+        self.interval = interval
+        self.stalls = collections.deque(maxlen=max_stalls)
+        self.stall_count = 0
+        self.worst_stall = 0
+        self.heartbeat = time.monotonic()
+        self.loop_thread_id = None
+        self.task = None
+
+    def start(self, loop):
+        """
+        Has to be called from within the loop being monitored - calling it again does nothing
+        """
+        if self.task is not None:
+            return
+
+        self.loop_thread_id = threading.get_ident()
+        self.heartbeat = time.monotonic()
+        self.task = loop.create_task(self.beat())
+        threading.Thread(target=self.watch, name="LoopMonitor", daemon=True).start()
+
+    async def beat(self):
+        while True:
+            self.heartbeat = time.monotonic()
+            await asyncio.sleep(self.interval)
+
+    def watch(self):
+        stall_start = None
+        stack = None
+
+        while True:
+            time.sleep(self.interval)
+            heartbeat = self.heartbeat
+
+            if stall_start is None:
+                if time.monotonic() - heartbeat - self.interval > self.threshold:
+                    # The loop is still stuck, so this is the stack of whatever is blocking it
+                    frame = sys._current_frames().get(self.loop_thread_id)
+                    stack = traceback.format_stack(frame) if frame is not None else []
+                    stall_start = heartbeat
+
+            elif heartbeat != stall_start:  # The loop has started running again
+                duration = heartbeat - stall_start - self.interval
+                self.stall_count += 1
+                self.worst_stall = max(self.worst_stall, duration)
+                self.stalls.append({"time": datetime.utcnow(), "duration": duration, "stack": stack})
+                stall_start = None
+
+
+def sample_profile(seconds, interval=0.005):
+    """
+    Samples the stack of every thread in the process, excluding the one doing the sampling
+
+    :param seconds: Float, how long to sample for - blocks for this long so run it in an executor
+    :param interval: Float, seconds between samples
+    :return: String, collapsed stacks ("frame;frame;frame count" per line) for flamegraph.pl/speedscope
+    """
+    sampler_id = threading.get_ident()
+    thread_names = {thread.ident: thread.name for thread in threading.enumerate()}
+    counts = collections.Counter()
+
+    end = time.monotonic() + seconds
+    while time.monotonic() < end:
+        for thread_id, frame in sys._current_frames().items():
+            if thread_id == sampler_id:
+                continue
+
+            stack = []
+            while frame is not None:
+                code = frame.f_code
+                stack.append("{} ({}:{})".format(code.co_name, os.path.basename(code.co_filename), frame.f_lineno))
+                frame = frame.f_back
+
+            stack.append(thread_names.get(thread_id, str(thread_id)))
+            counts[";".join(reversed(stack))] += 1
+
+        time.sleep(interval)
+
+    return "\n".join("{} {}".format(stack, count) for stack, count in counts.most_common())
@@ -0,0 +1,112 @@
+import time
+
+import discord
+
+
+class PageSession:
+    """
+    A single reaction menu - the embeds for every page are rendered once up front and reused when flipping pages
+    """
+
+    def __init__(self, message, author, pages, sends):
+        """
+        :param message: Discord Message the menu is shown in
+        :param author: Discord User who is allowed to use the menu
+        :param pages: List of Discord Embeds, one for each page
+        :param sends: SendScheduler the page edits go through
+        """
+        self.message = message
+        self.author = author
+        self.pages = pages
+        self.sends = sends
+        self.current_page_num = 0
+        self.last_used = time.monotonic()
+
+    async def handle(self, emoji):
+        """
+        :param emoji: String, the emoji the author reacted with
+        :return: Bool, False once the session is finished with
+        """
+        last_page_num = len(self.pages) - 1
+
+        if emoji == "<:cross:671116183780720670>":  # Close the menu
+            await self.message.delete()
+            return False
+
+        elif emoji == "⏪" and self.current_page_num != 0:  # Go to first page
+            self.current_page_num = 0
+        elif emoji == "⬅" and self.current_page_num != 0:  # Go back a page
+            self.current_page_num -= 1
+        elif emoji == "➡" and self.current_page_num != last_page_num:  # Go forward a page
+            self.current_page_num += 1
+        elif emoji == "⏩" and self.current_page_num != last_page_num:  # Go to last page
+            self.current_page_num = last_page_num
+        else:
+            return True  # Only need to edit the message if the page needs to be changed
+
+        await self.sends.edit(self.message, embed=self.pages[self.current_page_num])
+        return True
+
+
+class PaginationManager:
+    """
+    Routes every reaction the bot sees to the menu it belongs to, so there's only ever one listener no matter how
+    many menus are open. Menus that haven't been used for `timeout` seconds are forgotten.
+    """
+
+    controls = ["⏪", "⬅", "➡", "⏩", "<:cross:671116183780720670>"]
+
+    def __init__(self, sends, timeout=300):
+        """
+        :param sends: SendScheduler that menus are sent and flipped through
+        :param timeout: Int, seconds a menu is kept for after it was last used
+        """
+        self.sends = sends
+        self.timeout = timeout
+        self.sessions = {}  # Message ID: session
+
+    def expire(self):
+        now = time.monotonic()
+        for message_id in [message_id for message_id, session in self.sessions.items()
+                           if now - session.last_used > self.timeout]:
+            del self.sessions[message_id]
+
+    def register(self, session):
+        """
+        :param session: Any object with message, author and last_used attributes and an async handle(emoji) method
+        """
+        self.expire()
+        self.sessions[session.message.id] = session
+
+    async def paginate(self, ctx, pages):
+        """
+        :param ctx: Discord Context class
+        :param pages: List of Discord Embeds, one for each page
+        :return: Discord Message the menu was sent in
+        """
+        message = await self.sends.send(ctx, embed=pages[0])
+        self.register(PageSession(message, ctx.author, pages, self.sends))
+        for emoji in self.controls:
+            await message.add_reaction(emoji)
+
+        return message
+
+    async def on_reaction_add(self, reaction, user):
+        session = self.sessions.get(reaction.message.id)
+        if session is None or user != session.author:
+            return
+
+        if time.monotonic() - session.last_used > self.timeout:
+            del self.sessions[reaction.message.id]
+            return
+
+        session.last_used = time.monotonic()
+
+        if reaction.message.guild is not None:
+            try:
+                await reaction.message.remove_reaction(reaction.emoji, user)
+            except discord.errors.Forbidden:
+                pass
+
+        if not await session.handle(str(reaction)):
+            self.sessions.pop(reaction.message.id, None)
@@ -0,0 +1,106 @@
+import asyncio
+import collections
+import time
+
+import discord
+
+
+class SendScheduler:
+    """
+    Paces the messages the bot sends and edits in each channel to 5 every 5 seconds, Discord's documented
+    per-channel limit. It doesn't read Discord's X-RateLimit headers - discord.py already waits out any 429 that
+    happens - it just spaces out bursts of the bot's own messages so they don't run into one in the first place.
+    Deletes have a separate limit on Discord's side so they don't go through here.
+    """
+
+    def __init__(self, rate=5, per=5.0):
+        """
+        :param rate: Int, messages allowed in each channel...
+        :param per: Float, ...every this many seconds
+        """
+        self.rate = rate
+        self.per = per
+        self.buckets = {}  # Channel ID: deque of recent send/edit times
+        self.locks = {}
+        self.sent = 0
+        self.delayed = 0
+
+    def prune(self):
+        # Forgetting channels that haven't had anything sent in them recently
+        now = time.monotonic()
+        for channel_id in [channel_id for channel_id, bucket in self.buckets.items()
+                           if now - bucket[-1] > self.per and not self.locks[channel_id].locked()]:
+            del self.buckets[channel_id]
+            del self.locks[channel_id]
+
+    async def wait(self, channel_id):
+        """
+        Waits until there's room in the channel's bucket and takes a slot in it
+        """
+        self.prune()
+
+        lock = self.locks.setdefault(channel_id, asyncio.Lock())
+        async with lock:
+            bucket = self.buckets.setdefault(channel_id, collections.deque(maxlen=self.rate))
+            if len(bucket) == self.rate:
+                wait = self.per - (time.monotonic() - bucket[0])
+                if wait > 0:
+                    self.delayed += 1
+                    await asyncio.sleep(wait)
+            bucket.append(time.monotonic())
+
+        self.sent += 1
+
+    async def send(self, destination, content=None, **kwargs):
+        """
+        :param destination: Discord Messageable, e.g. a Context or a Channel
+        :param kwargs: Passed on to destination.send()
+        :return: Discord Message that was sent
+        """
+        await self.wait(getattr(destination, "channel", destination).id)
+        return await destination.send(content, **kwargs)
+
+    async def edit(self, message, **kwargs):
+        """
+        :param message: Discord Message to edit
+        :param kwargs: Passed on to message.edit()
+        """
+        await self.wait(message.channel.id)
+        await message.edit(**kwargs)
+
+
+class AssetCache:
+    """
+    Static images (thumbnails) are only uploaded once - after that the URL of the upload is used instead
+    """
+
+    def __init__(self):
+        self.urls = {}  # Key: (attachment URL, ID of the message it was uploaded with)
+
+    def attach(self, key, set_url, fp, filename):
+        """
+        :param key: Any hashable that identifies the asset, e.g. its path
+        :param set_url: Embed method to give the URL to, e.g. embed.set_thumbnail
+        :param fp: File path or file-like object of the asset - only used if it hasn't been uploaded yet
+        :param filename: String, filename to upload the asset as
+        :return: Discord File to send with the embed or None if the asset has already been uploaded
+        """
+        if key in self.urls:
+            set_url(url=self.urls[key][0])
+            return None
+
+        set_url(url="attachment://{}".format(filename))
+        return discord.File(fp, filename=filename)
+
+    def remember(self, key, message, filename):
+        """
+        Call after sending a message with a File from attach() so the upload can be reused
+        """
+        for attachment in message.attachments:
+            if attachment.filename == filename:
+                self.urls[key] = (attachment.url, message.id)
+
+    def forget_message(self, message_id):
+        # Uploads disappear along with their message so they can't be reused after it's deleted
+        for key in [key for key, (url, asset_message_id) in self.urls.items() if asset_message_id == message_id]:
+            del self.urls[key]